@@ -1,12 +1,9 @@
-
-### `backend/` Directory
-
-#### `backend/api/app_prod.py`
-```python
-from fastapi import FastAPI, UploadFile, File, WebSocket, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, WebSocket, HTTPException, BackgroundTasks, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os, uuid, shutil, asyncio, json, time
+import os, secrets, asyncio, time
+import aiofiles
+import orjson
 from typing import Dict, List
 import redis.asyncio as redis
 import websockets
@@ -16,6 +13,11 @@ from prometheus_client import Counter, Histogram, Gauge, start_http_server
 import logging
 from contextlib import asynccontextmanager
 
+# Config: read the environment once at import, not per request
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', '2147483648'))  # 2GB
+ALLOWED_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+INPUT_DIR = '/app/input_videos'
+
 # Metrics
 REQUEST_COUNT = Counter('api_requests_total', 'Total API requests', ['method', 'endpoint'])
 REQUEST_DURATION = Histogram('api_request_duration_seconds', 'Request duration')
@@ -62,9 +64,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Bounded set of endpoint labels: always label by route template, never
+# by raw path, so /job/{job_id}/status stays one time series instead of
+# one per job_id
+_ALLOWED_ENDPOINTS = {'/upload', '/upload_bulk', '/job/{job_id}/status', '/health', '/metrics'}
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    response = await call_next(request)
+    route = request.scope.get('route')
+    endpoint = route.path if route is not None and route.path in _ALLOWED_ENDPOINTS else 'other'
+    REQUEST_COUNT.labels(method=request.method, endpoint=endpoint).inc()
+    return response
+
 # Redis connection
 redis_client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
 
+# Bulk enqueue: LPUSH + SET for every job plus the final queue length
+# run server-side in one script, so a batch of N jobs costs one
+# round-trip instead of 2N+1
+_enqueue_script = redis_client.register_script("""
+local q = KEYS[1]
+for i = 1, #ARGV, 2 do
+    redis.call('LPUSH', q, ARGV[i])
+    redis.call('SET', 'job:' .. ARGV[i + 1], ARGV[i])
+end
+return redis.call('LLEN', q)
+""")
+
+def _sendfile_copy(src_fd: int, dst_fd: int, size: int):
+    """Copy an uploaded file in kernel space, skipping user-space buffers"""
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, 1 << 24)
+        if not sent:
+            break
+        offset += sent
+
 # WebSocket connections manager
 class ConnectionManager:
     def __init__(self):
@@ -83,52 +119,87 @@ class ConnectionManager:
     async def send_progress(self, client_id: str, progress: dict):
         if client_id in self.active_connections:
             try:
-                await self.active_connections[client_id].send_text(json.dumps(progress))
+                await self.active_connections[client_id].send_bytes(orjson.dumps(progress))
             except Exception as e:
                 logger.error(f"Failed to send progress to {client_id}: {e}")
                 self.disconnect(client_id)
 
 manager = ConnectionManager()
 
+async def _save_upload(file: UploadFile) -> dict:
+    """Validate an upload, write it to disk and return its job data"""
+    if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Invalid file format")
+
+    # Generate unique job ID; token_hex amortizes its urandom reads and
+    # skips UUID formatting, and the hyphen-free ids make shorter keys
+    job_id = secrets.token_hex(16)
+    filename = f"{job_id}_{file.filename}"
+    filepath = f"{INPUT_DIR}/{filename}"
+
+    # Prefer a zero-copy kernel-space transfer when the upload is
+    # already spooled to a real file; large multipart bodies roll
+    # over to disk, so this covers the expensive case
+    try:
+        src_fd = file.file.fileno()
+    except (AttributeError, OSError, ValueError):
+        src_fd = None
+
+    try:
+        if src_fd is not None and hasattr(os, 'sendfile'):
+            size = os.fstat(src_fd).st_size
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail="File too large")
+            with open(filepath, 'wb') as f:
+                await asyncio.to_thread(_sendfile_copy, src_fd, f.fileno(), size)
+        else:
+            # Stream to disk in 1MB chunks without blocking the event
+            # loop, enforcing the size limit as bytes arrive so
+            # oversized uploads are rejected before they fill the disk
+            bytes_written = 0
+            async with aiofiles.open(filepath, 'wb') as f:
+                while chunk := await file.read(1 << 20):
+                    bytes_written += len(chunk)
+                    if bytes_written > MAX_UPLOAD_SIZE:
+                        raise HTTPException(status_code=413, detail="File too large")
+                    await f.write(chunk)
+    except BaseException:
+        # Never leave a partial file behind, whichever branch was
+        # writing and whatever went wrong (413, disk full, cancel)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
+
+    return {
+        'job_id': job_id,
+        'filename': filename,
+        'filepath': filepath,
+        'status': 'queued',
+        'created_at': time.time(),
+        'retries': 0,
+        'max_retries': 3
+    }
+
 # Enhanced upload endpoint with validation and monitoring
 @app.post('/upload')
 async def upload_video(file: UploadFile = File(...)):
-    REQUEST_COUNT.labels(method='POST', endpoint='/upload').inc()
     start_time = time.time()
     
     try:
-        # Validation
-        if not file.filename.lower().endswith(('.mp4', '.mov', '.avi', '.mkv')):
-            raise HTTPException(status_code=400, detail="Invalid file format")
-        
-        if file.size > int(os.getenv('MAX_UPLOAD_SIZE', '2147483648')):  # 2GB
-            raise HTTPException(status_code=400, detail="File too large")
-        
-        # Generate unique job ID
-        job_id = str(uuid.uuid4())
-        filename = f"{job_id}_{file.filename}"
-        filepath = os.path.join('/app/input_videos', filename)
-        
-        # Save file with progress tracking
-        with open(filepath, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
-        
-        # Enqueue job with retry mechanism
-        job_data = {
-            'job_id': job_id,
-            'filename': filename,
-            'filepath': filepath,
-            'status': 'queued',
-            'created_at': time.time(),
-            'retries': 0,
-            'max_retries': 3
-        }
-        
-        await redis_client.lpush('colmap_jobs', json.dumps(job_data))
-        await redis_client.set(f"job:{job_id}", json.dumps(job_data))
-        
+        job_data = await _save_upload(file)
+        job_id = job_data['job_id']
+
+        # Single round-trip: queue the job, store its status and read the
+        # queue length in one pipelined request instead of three awaits
+        payload = orjson.dumps(job_data)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.lpush('colmap_jobs', payload)
+            pipe.set(f"job:{job_id}", payload)
+            pipe.llen('colmap_jobs')
+            _, _, queue_length = await pipe.execute()
+
         ACTIVE_JOBS.inc()
-        QUEUE_SIZE.set(await redis_client.llen('colmap_jobs'))
+        QUEUE_SIZE.set(queue_length)
         
         logger.info(f"Job {job_id} queued successfully")
         
@@ -138,6 +209,8 @@ async def upload_video(file: UploadFile = File(...)):
             'message': 'File uploaded and queued for processing'
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -145,6 +218,53 @@ async def upload_video(file: UploadFile = File(...)):
     finally:
         REQUEST_DURATION.observe(time.time() - start_time)
 
+# Bulk upload endpoint: one Redis round-trip for the whole batch
+@app.post('/upload_bulk')
+async def upload_videos(files: List[UploadFile] = File(...)):
+    start_time = time.time()
+
+    try:
+        job_ids = []
+        script_args = []
+        saved_paths = []
+        try:
+            for file in files:
+                job_data = await _save_upload(file)
+                saved_paths.append(job_data['filepath'])
+                script_args.extend([orjson.dumps(job_data), job_data['job_id']])
+                job_ids.append(job_data['job_id'])
+        except Exception:
+            # All-or-nothing: nothing is enqueued yet, so drop the
+            # files already written or they leak in INPUT_DIR forever
+            for path in saved_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+
+        queue_length = await _enqueue_script(keys=['colmap_jobs'], args=script_args)
+
+        ACTIVE_JOBS.inc(len(job_ids))
+        QUEUE_SIZE.set(queue_length)
+
+        logger.info(f"Bulk-queued {len(job_ids)} jobs")
+
+        return JSONResponse({
+            'status': 'success',
+            'job_ids': job_ids,
+            'message': f'{len(job_ids)} files uploaded and queued for processing'
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk upload failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        REQUEST_DURATION.observe(time.time() - start_time)
+
 # Job status endpoint
 @app.get('/job/{job_id}/status')
 async def get_job_status(job_id: str):
@@ -153,22 +273,37 @@ async def get_job_status(job_id: str):
         if not job_data:
             raise HTTPException(status_code=404, detail="Job not found")
         
-        return JSONResponse(json.loads(job_data))
+        return JSONResponse(orjson.loads(job_data))
     
     except Exception as e:
         logger.error(f"Status check failed for {job_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _forward_progress(pubsub, websocket: WebSocket):
+    """Forward Redis progress messages to a connected WebSocket client"""
+    async for message in pubsub.listen():
+        if message['type'] == 'pmessage':
+            await websocket.send_bytes(message['data'])
+
 # WebSocket endpoint for real-time progress
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await manager.connect(websocket, client_id)
+
+    # Subscribe this connection to progress updates; without this the
+    # endpoint only ever received and clients got no data at all
+    pubsub = redis_client.pubsub()
+    await pubsub.psubscribe('progress:*')
+    forward_task = asyncio.create_task(_forward_progress(pubsub, websocket))
+
     try:
         while True:
             await websocket.receive_text()
     except Exception as e:
         logger.error(f"WebSocket error for {client_id}: {e}")
     finally:
+        forward_task.cancel()
+        await pubsub.close()
         manager.disconnect(client_id)
 
 # Health check with detailed status
@@ -201,4 +336,4 @@ async def get_metrics():
         'active_jobs': ACTIVE_JOBS._value.get(),
         'queue_size': QUEUE_SIZE._value.get(),
         'total_requests': REQUEST_COUNT._value.sum()
-    }
\ No newline at end of file
+    }
@@ -1,12 +1,16 @@
 import bpy
 import sys
 import os
-import json
+import orjson
 import time
 import logging
 import traceback
+import struct
 import subprocess
+import queue
+import threading
 from pathlib import Path
+import numpy as np
 import redis
 import requests
 
@@ -24,8 +28,57 @@ logger = logging.getLogger(__name__)
 # Redis connection
 redis_client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
 
+# Worker config, read once at import
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
+RETRY_DELAY = 30
+
+# Optional HTTP fallback for deployments where the WebSocket server
+# cannot reach Redis. Off by default - the pub/sub path supersedes it -
+# and when enabled it posts through one pooled keep-alive session
+# instead of a fresh TCP handshake per update.
+if os.getenv('ENABLE_HTTP_PROGRESS'):
+    _http_session = requests.Session()
+    _http_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=4))
+    _progress_url = os.getenv('WEBSOCKET_URL', 'ws://websocket:8765').replace('ws://', 'http://') + '/progress'
+else:
+    _http_session = None
+
+# Progress updates are queued here and flushed by a background thread so
+# the import/render hot path never blocks on the network
+_progress_queue = queue.Queue()
+
+def _progress_publisher():
+    """Drain queued progress messages and publish each batch in one pipeline"""
+    while True:
+        batch = [_progress_queue.get()]
+        while len(batch) < 100:
+            try:
+                batch.append(_progress_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for channel, payload in batch:
+                pipe.publish(channel, payload)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to publish progress batch: {e}")
+
+        if _http_session is not None:
+            for _, payload in batch:
+                try:
+                    _http_session.post(_progress_url, data=payload,
+                                       headers={'Content-Type': 'application/json'},
+                                       timeout=1)
+                except requests.RequestException as e:
+                    logger.warning(f"HTTP progress post failed: {e}")
+
+_publisher_thread = threading.Thread(target=_progress_publisher, daemon=True)
+_publisher_thread.start()
+
 def report_progress(job_id, stage, progress, message):
-    """Report progress via WebSocket and Redis"""
+    """Queue a progress update for the background Redis publisher"""
     try:
         payload = {
             "job_id": job_id,
@@ -34,17 +87,12 @@ def report_progress(job_id, stage, progress, message):
             "message": message,
             "timestamp": time.time()
         }
-        
-        # Send to WebSocket server
-        websocket_url = os.getenv('WEBSOCKET_URL', 'ws://websocket:8765')
-        if websocket_url.startswith('ws://'):
-            websocket_url = websocket_url.replace('ws://', 'http://') + '/progress'
-        
-        requests.post(websocket_url, json=payload, timeout=5)
-        
-        # Publish to Redis
-        redis_client.publish(f"progress:{job_id}", json.dumps(payload))
-        
+
+        # The WebSocket server's redis_listener already forwards
+        # progress:* messages to clients, so Redis pub/sub is the only
+        # hop needed here
+        _progress_queue.put((f"progress:{job_id}", orjson.dumps(payload)))
+
     except Exception as e:
         logger.error(f"Failed to report progress: {e}")
 
@@ -87,16 +135,59 @@ def install_colmap_addon():
         logger.error(f"Addon installation failed: {e}")
         return False
 
+def _load_points3d(points_path):
+    """Parse COLMAP points3D.bin into an (N, 3) float32 coordinate array.
+
+    Record layout: uint64 id, 3x float64 xyz, 3x uint8 rgb,
+    float64 error, uint64 track_length, then track_length pairs of
+    uint32 (image_id, point2D_idx).
+    """
+    with open(points_path, 'rb') as f:
+        num_points = struct.unpack('<Q', f.read(8))[0]
+        raw = f.read()
+
+    # Track lengths vary per record, so walk the buffer once collecting
+    # record offsets, then gather the fixed-size xyz fields in bulk
+    offsets = np.empty(num_points, dtype=np.int64)
+    pos = 0
+    for i in range(num_points):
+        offsets[i] = pos
+        track_len = struct.unpack_from('<Q', raw, pos + 43)[0]
+        pos += 51 + 8 * track_len
+
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    xyz_idx = (offsets[:, None] + (8 + np.arange(24))).ravel()
+    xyz = buf[xyz_idx].view(np.float64).reshape(-1, 3)
+    return xyz.astype(np.float32)
+
+def _import_sparse_points(sparse_path):
+    """Build one point-cloud mesh straight from points3D.bin.
+
+    The addon's pure-Python parser allocates an object per point and
+    dominates import time for large scenes; this reads the binary
+    records with numpy and fills a single mesh via foreach_set.
+    """
+    xyz = _load_points3d(sparse_path / "points3D.bin")
+
+    mesh = bpy.data.meshes.new("sparse_point_cloud")
+    mesh.vertices.add(len(xyz))
+    mesh.vertices.foreach_set('co', xyz.ravel())
+    mesh.update()
+
+    obj = bpy.data.objects.new("sparse_point_cloud", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return len(xyz)
+
 def import_colmap_scene(scene_path, job_id):
     """Import COLMAP scene with error handling"""
     try:
-        # Reset Blender scene
-        bpy.ops.wm.read_factory_settings(use_empty=True)
-        
-        # Install addon
-        if not install_colmap_addon():
-            raise Exception("Failed to install COLMAP addon")
-        
+        # Reset the scene only; re-reading factory settings here would
+        # wipe the addon enabled at startup
+        bpy.ops.wm.read_homefile(use_empty=True)
+
+        if not _ADDON_READY:
+            raise Exception("COLMAP addon not available")
+
         report_progress(job_id, "blender_import", 10, "Preparing Blender scene")
         
         # Check for sparse reconstruction
@@ -111,6 +202,17 @@ def import_colmap_scene(scene_path, job_id):
         
         report_progress(job_id, "blender_import", 30, "Loading COLMAP data")
         
+        # Parse the point cloud directly with numpy; the addon then only
+        # has to handle cameras. Fall back to its own point import if
+        # the binary layout is unexpected.
+        points_loaded = False
+        try:
+            n_points = _import_sparse_points(sparse_path)
+            points_loaded = True
+            logger.info(f"Imported {n_points} sparse points via numpy parser")
+        except Exception as e:
+            logger.warning(f"Numpy point import failed, falling back to addon: {e}")
+
         # Import COLMAP data
         try:
             bpy.ops.import_scene.colmap(
@@ -118,7 +220,7 @@ def import_colmap_scene(scene_path, job_id):
                 colmap_image_folder_path=str(Path(scene_path).parent / "temp_images"),
                 suppress_distortion_warnings=True,
                 add_camera_motion_as_animation=True,
-                add_points_as_point_cloud=True,
+                add_points_as_point_cloud=not points_loaded,
                 add_cameras=True
             )
         except Exception as e:
@@ -150,6 +252,20 @@ def import_colmap_scene(scene_path, job_id):
         logger.error(traceback.format_exc())
         return False
 
+def _find_view3d_space():
+    """Locate the 3D viewport space; None in headless/background runs.
+
+    Resolved per call rather than cached: each job's read_homefile
+    reloads every datablock, so a stored space reference would dangle.
+    The bpy.app.background check keeps this free where it matters.
+    """
+    if bpy.app.background:
+        return None
+    try:
+        return next((a.spaces[0] for a in bpy.context.screen.areas if a.type == 'VIEW_3D'), None)
+    except AttributeError:
+        return None
+
 def optimize_scene():
     """Optimize the imported scene for better performance"""
     try:
@@ -157,18 +273,31 @@ def optimize_scene():
         point_clouds = [obj for obj in bpy.context.scene.objects if obj.type == 'MESH' and 'point' in obj.name.lower()]
         
         for pc in point_clouds:
-            if len(pc.data.vertices) > 100000:  # If more than 100k points
-                # Add decimation modifier
-                dec_mod = pc.modifiers.new(name="Decimate", type='DECIMATE')
-                dec_mod.ratio = 0.5  # Reduce by half
-                logger.info(f"Added decimation to {pc.name}")
-        
-        # Setup efficient viewport shading
-        for area in bpy.context.screen.areas:
-            if area.type == 'VIEW_3D':
-                area.spaces[0].shading.type = 'SOLID'
-                break
-                
+            n = len(pc.data.vertices)
+            if n > 100000:  # If more than 100k points
+                # Stochastically subsample to half the points with numpy;
+                # the Decimate modifier targets surface meshes and would
+                # evaluate a full copy of the mesh on every render
+                coords = np.empty(3 * n, dtype=np.float32)
+                pc.data.vertices.foreach_get('co', coords)
+                kept = coords.reshape(-1, 3)[np.random.rand(n) < 0.5]
+
+                old_mesh = pc.data
+                new_mesh = bpy.data.meshes.new(pc.name + '_dec')
+                new_mesh.vertices.add(len(kept))
+                new_mesh.vertices.foreach_set('co', kept.ravel())
+                new_mesh.update()
+                pc.data = new_mesh
+                bpy.data.meshes.remove(old_mesh)
+                logger.info(f"Subsampled {pc.name}: {n} -> {len(kept)} points")
+        
+        # Viewport shading only matters in interactive sessions; batch
+        # workers run headless and have no screen at all
+        view3d_space = _find_view3d_space()
+        if view3d_space is not None:
+            view3d_space.shading.type = 'SOLID'
+
+
     except Exception as e:
         logger.warning(f"Scene optimization failed: {e}")
 
@@ -204,31 +333,58 @@ def setup_camera_animation(cameras):
         # Animate primary camera through all positions
         main_camera = cameras[0]
         main_camera.name = "AnimatedCamera"
-        
-        for i, cam in enumerate(cameras[1:], 1):
-            frame = i * 5
-            
-            # Copy location and rotation
-            main_camera.location = cam.location.copy()
-            main_camera.rotation_euler = cam.rotation_euler.copy()
-            
-            # Insert keyframes
-            main_camera.keyframe_insert(data_path="location", frame=frame)
-            main_camera.keyframe_insert(data_path="rotation_euler", frame=frame)
-        
-        # Set interpolation to bezier for smooth animation
-        if main_camera.animation_data and main_camera.animation_data.action:
-            for fcurve in main_camera.animation_data.action.fcurves:
-                for keyframe in fcurve.keyframe_points:
-                    keyframe.interpolation = 'BEZIER'
-                    keyframe.handle_left_type = 'AUTO'
-                    keyframe.handle_right_type = 'AUTO'
-        
-        logger.info(f"Created camera animation with {len(cameras)} keyframes")
+
+        # Gather all transforms into flat numpy buffers and write every
+        # keyframe in one foreach_set call per fcurve, instead of two
+        # keyframe_insert calls per camera
+        n = len(cameras)
+        frames = np.arange(n, dtype=np.float32) * 5
+        frames[0] = 1.0
+        locations = np.array([cam.location[:] for cam in cameras], dtype=np.float32)
+        rotations = np.array([cam.rotation_euler[:] for cam in cameras], dtype=np.float32)
+
+        if main_camera.animation_data is None:
+            main_camera.animation_data_create()
+        action = bpy.data.actions.new(name="CameraPathAction")
+        main_camera.animation_data.action = action
+
+        bezier = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items['BEZIER'].value
+        interpolation = np.full(n, bezier, dtype=np.int32)
+
+        for data_path, values in (("location", locations), ("rotation_euler", rotations)):
+            for axis in range(3):
+                fcurve = action.fcurves.new(data_path=data_path, index=axis)
+                co = np.empty(2 * n, dtype=np.float32)
+                co[0::2] = frames
+                co[1::2] = values[:, axis]
+                fcurve.keyframe_points.add(n)
+                fcurve.keyframe_points.foreach_set('co', co)
+                fcurve.keyframe_points.foreach_set('interpolation', interpolation)
+                fcurve.update()
+
+        logger.info(f"Created camera animation with {n} keyframes")
         
     except Exception as e:
         logger.warning(f"Camera animation setup failed: {e}")
 
+def _commit_status(job_data, stage, progress, message):
+    """Write job status and publish its progress event in one round-trip"""
+    try:
+        job_id = job_data['job_id']
+        payload = {
+            "job_id": job_id,
+            "stage": stage,
+            "progress": progress,
+            "message": message,
+            "timestamp": time.time()
+        }
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(f"job:{job_id}", orjson.dumps(job_data))
+        pipe.publish(f"progress:{job_id}", orjson.dumps(payload))
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Failed to commit status: {e}")
+
 def process_blender_job(job_data):
     """Process a single Blender job"""
     job_id = job_data.get('job_id')
@@ -241,7 +397,7 @@ def process_blender_job(job_data):
         # Update job status
         job_data['status'] = 'processing_blender'
         job_data['blender_started_at'] = time.time()
-        redis_client.set(f"job:{job_id}", json.dumps(job_data))
+        _commit_status(job_data, "blender_start", 0, "Starting Blender processing")
         
         # Validate paths
         if not os.path.exists(scene_path):
@@ -271,9 +427,7 @@ def process_blender_job(job_data):
         job_data['completed_at'] = time.time()
         job_data['output_file'] = output_path
         job_data['file_size'] = file_size
-        redis_client.set(f"job:{job_id}", json.dumps(job_data))
-        
-        report_progress(job_id, "completed", 100, f"Processing completed. File saved: {os.path.basename(output_path)}")
+        _commit_status(job_data, "completed", 100, f"Processing completed. File saved: {os.path.basename(output_path)}")
         
         return True
         
@@ -285,19 +439,14 @@ def process_blender_job(job_data):
         job_data['status'] = 'failed_blender'
         job_data['error'] = str(e)
         job_data['failed_at'] = time.time()
-        redis_client.set(f"job:{job_id}", json.dumps(job_data))
-        
-        report_progress(job_id, "failed", 0, f"Blender processing failed: {str(e)}")
+        _commit_status(job_data, "failed", 0, f"Blender processing failed: {str(e)}")
         
         return False
 
 def main_worker_loop():
     """Main Blender worker loop"""
     logger.info("Starting Enhanced Blender Worker")
-    
-    max_retries = int(os.getenv('MAX_RETRIES', '3'))
-    retry_delay = 30
-    
+
     while True:
         try:
             # Get job from queue
@@ -307,7 +456,7 @@ def main_worker_loop():
                 continue
             
             _, job_data_str = job_result
-            job_data = json.loads(job_data_str)
+            job_data = orjson.loads(job_data_str)
             
             job_id = job_data.get('job_id')
             retries = job_data.get('blender_retries', 0)
@@ -319,19 +468,19 @@ def main_worker_loop():
                 logger.info(f"Blender job {job_id} completed successfully")
             else:
                 # Handle retry logic
-                if retries < max_retries:
+                if retries < MAX_RETRIES:
                     new_retries = retries + 1
-                    logger.info(f"Blender job {job_id} failed, retrying ({new_retries}/{max_retries})")
+                    logger.info(f"Blender job {job_id} failed, retrying ({new_retries}/{MAX_RETRIES})")
                     
                     job_data['blender_retries'] = new_retries
                     job_data['status'] = 'retry_blender'
                     
                     # Re-queue with delay
-                    time.sleep(retry_delay)
-                    redis_client.lpush('blender_jobs', json.dumps(job_data))
+                    time.sleep(RETRY_DELAY)
+                    redis_client.lpush('blender_jobs', orjson.dumps(job_data))
                 else:
-                    logger.error(f"Blender job {job_id} failed after {max_retries} attempts")
-                    redis_client.lpush('failed_blender_jobs', json.dumps(job_data))
+                    logger.error(f"Blender job {job_id} failed after {MAX_RETRIES} attempts")
+                    redis_client.lpush('failed_blender_jobs', orjson.dumps(job_data))
             
         except KeyboardInterrupt:
             logger.info("Worker interrupted, shutting down...")
@@ -341,5 +490,10 @@ def main_worker_loop():
             logger.error(traceback.format_exc())
             time.sleep(10)  # Brief pause before continuing
 
+# One-shot addon install at worker startup: the install/enable ops hit
+# the preferences directory on disk and cost hundreds of ms, so doing
+# them per job was pure overhead
+_ADDON_READY = install_colmap_addon()
+
 if __name__ == "__main__":
     main_worker_loop()
\ No newline at end of file
@@ -1,69 +1,98 @@
 import asyncio
 import websockets
-import json
+import orjson
 import redis.asyncio as redis
 import logging
-from typing import Set, Dict
+from collections import defaultdict
+from typing import Dict, Set
 import os
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Constant envelope fragments, precomputed so the hot paths only do
+# byte concatenation instead of running the JSON encoder. Safe because
+# client_id is sanitized on ingest and job ids are server-generated.
+_CONN_PREFIX = b'{"type":"connection","status":"connected","client_id":"'
+_CONN_SUFFIX = b'"}'
+_PROGRESS_PREFIX = b'{"type":"progress_update","job_id":"'
+
 class WebSocketServer:
     def __init__(self):
-        self.clients: Dict[str, websockets.WebSocketServerProtocol] = {}
-        self.redis_client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
-        
+        # Plain set of protocols: the client id is stored on the
+        # protocol object itself, so there is no per-connection dict
+        # entry duplicating it
+        self.clients: Set[websockets.WebSocketServerProtocol] = set()
+
+        # Commands and pub/sub get their own connections: the listener
+        # parks its connection inside listen() indefinitely, which
+        # would starve a shared pool under load. The command pool
+        # blocks when exhausted so bursts queue up instead of raising
+        # MaxConnectionsError.
+        redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+        self.cmd_redis = redis.Redis(
+            connection_pool=redis.BlockingConnectionPool.from_url(
+                redis_url, max_connections=4, timeout=5
+            )
+        )
+        self.pub_redis = redis.Redis.from_url(redis_url)
+        self.pubsub = self.pub_redis.pubsub()
+
+        # Which clients care about which job; the Redis channel for a
+        # job is only subscribed while someone is watching it
+        self.subscriptions: Dict[str, Set[websockets.WebSocketServerProtocol]] = defaultdict(set)
+
     async def register_client(self, websocket: websockets.WebSocketServerProtocol, client_id: str):
         """Register a new WebSocket client"""
-        self.clients[client_id] = websocket
+        websocket.client_id = client_id
+        self.clients.add(websocket)
         logger.info(f"Client {client_id} connected. Total clients: {len(self.clients)}")
-        
+
         # Send initial status
-        await self.send_to_client(client_id, {
-            "type": "connection",
-            "status": "connected",
-            "client_id": client_id
-        })
-    
-    async def unregister_client(self, client_id: str):
+        try:
+            await websocket.send(_CONN_PREFIX + client_id.encode('utf-8') + _CONN_SUFFIX)
+        except websockets.exceptions.ConnectionClosed:
+            await self.unregister_client(websocket)
+
+    async def unregister_client(self, websocket: websockets.WebSocketServerProtocol):
         """Unregister a WebSocket client"""
-        if client_id in self.clients:
-            del self.clients[client_id]
-            logger.info(f"Client {client_id} disconnected. Total clients: {len(self.clients)}")
-    
-    async def send_to_client(self, client_id: str, message: dict):
+        if websocket in self.clients:
+            self.clients.discard(websocket)
+
+            # Drop this client's job subscriptions and release channels
+            # nobody watches anymore so Redis stops delivering them
+            for job_id in [j for j, subs in self.subscriptions.items() if websocket in subs]:
+                subs = self.subscriptions[job_id]
+                subs.discard(websocket)
+                if not subs:
+                    del self.subscriptions[job_id]
+                    await self.pubsub.unsubscribe(f'progress:{job_id}')
+
+            logger.info(f"Client {getattr(websocket, 'client_id', '?')} disconnected. Total clients: {len(self.clients)}")
+
+    async def send_to_client(self, websocket: websockets.WebSocketServerProtocol, message: dict):
         """Send message to specific client"""
-        if client_id in self.clients:
-            try:
-                await self.clients[client_id].send(json.dumps(message))
-                return True
-            except websockets.exceptions.ConnectionClosed:
-                await self.unregister_client(client_id)
-                return False
-            except Exception as e:
-                logger.error(f"Error sending to client {client_id}: {e}")
-                return False
-        return False
-    
+        try:
+            await websocket.send(orjson.dumps(message))
+            return True
+        except websockets.exceptions.ConnectionClosed:
+            await self.unregister_client(websocket)
+            return False
+        except Exception as e:
+            logger.error(f"Error sending to client {getattr(websocket, 'client_id', '?')}: {e}")
+            return False
+
     async def broadcast(self, message: dict):
         """Broadcast message to all connected clients"""
         if not self.clients:
             return
-        
-        disconnected_clients = []
-        for client_id, websocket in self.clients.items():
-            try:
-                await websocket.send(json.dumps(message))
-            except websockets.exceptions.ConnectionClosed:
-                disconnected_clients.append(client_id)
-            except Exception as e:
-                logger.error(f"Error broadcasting to {client_id}: {e}")
-                disconnected_clients.append(client_id)
-        
-        # Clean up disconnected clients
-        for client_id in disconnected_clients:
-            await self.unregister_client(client_id)
+
+        # Serialize once and hand the frame to every transport's send
+        # buffer without awaiting, so one slow client can't stall the
+        # rest; closed connections are skipped and cleaned up by their
+        # own handle_client finally block
+        payload = orjson.dumps(message)
+        websockets.broadcast(self.clients, payload)
     
     async def handle_client(self, websocket, path):
         """Handle individual WebSocket client connection"""
@@ -71,61 +100,78 @@ class WebSocketServer:
         try:
             # Wait for client identification
             async for message in websocket:
-                data = json.loads(message)
+                data = orjson.loads(message)
                 
                 if data.get('type') == 'identify':
                     client_id = data.get('client_id', f"client_{id(websocket)}")
+                    # client_id is spliced into raw JSON envelopes, so
+                    # reject anything that could escape a JSON string
+                    if not isinstance(client_id, str) or not client_id.replace('-', '').replace('_', '').isalnum():
+                        client_id = f"client_{id(websocket)}"
                     await self.register_client(websocket, client_id)
                 elif data.get('type') == 'subscribe_job':
                     job_id = data.get('job_id')
                     if job_id and client_id:
-                        await self.subscribe_to_job_progress(client_id, job_id)
-                        
+                        await self.subscribe_to_job_progress(websocket, job_id)
+
         except websockets.exceptions.ConnectionClosed:
             pass
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
         finally:
             if client_id:
-                await self.unregister_client(client_id)
-    
-    async def subscribe_to_job_progress(self, client_id: str, job_id: str):
+                await self.unregister_client(websocket)
+
+    async def subscribe_to_job_progress(self, websocket: websockets.WebSocketServerProtocol, job_id: str):
         """Subscribe client to job progress updates"""
         try:
+            if job_id not in self.subscriptions:
+                # First watcher: start receiving this job's channel
+                await self.pubsub.subscribe(f'progress:{job_id}')
+            self.subscriptions[job_id].add(websocket)
+
             # Get current job status
-            job_data = await self.redis_client.get(f"job:{job_id}")
+            job_data = await self.cmd_redis.get(f"job:{job_id}")
             if job_data:
-                await self.send_to_client(client_id, {
+                await self.send_to_client(websocket, {
                     "type": "job_status",
                     "job_id": job_id,
-                    "data": json.loads(job_data)
+                    "data": orjson.loads(job_data)
                 })
         except Exception as e:
             logger.error(f"Error subscribing to job {job_id}: {e}")
     
     async def redis_listener(self):
         """Listen for Redis pub/sub messages and forward to WebSocket clients"""
-        pubsub = self.redis_client.pubsub()
-        await pubsub.psubscribe('progress:*')
-        
+        # The control channel keeps the listener alive while per-job
+        # channels come and go with client subscriptions
+        await self.pubsub.subscribe('progress_control')
+
         logger.info("Started Redis listener for progress updates")
-        
-        async for message in pubsub.listen():
-            if message['type'] == 'pmessage':
-                try:
-                    channel = message['channel'].decode('utf-8')
-                    job_id = channel.split(':', 1)[1]  # Extract job_id from 'progress:job_id'
-                    data = json.loads(message['data'])
-                    
-                    # Broadcast to all clients (you could filter by job_id if needed)
-                    await self.broadcast({
-                        "type": "progress_update",
-                        "job_id": job_id,
-                        "data": data
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"Error processing Redis message: {e}")
+
+        async for message in self.pubsub.listen():
+            if message['type'] != 'message':
+                continue
+            try:
+                channel = message['channel'].decode('utf-8')
+                if not channel.startswith('progress:'):
+                    continue
+                job_id = channel.split(':', 1)[1]  # Extract job_id from 'progress:job_id'
+
+                # Only the clients watching this job get the event
+                subscribers = self.subscriptions.get(job_id)
+                if not subscribers:
+                    continue
+
+                # message['data'] is already JSON bytes from the
+                # publisher, so splice it into the envelope directly
+                # instead of decode + loads + dumps + encode per event
+                payload = (_PROGRESS_PREFIX + job_id.encode('utf-8')
+                           + b'","data":' + message['data'] + b'}')
+                websockets.broadcast(subscribers, payload)
+
+            except Exception as e:
+                logger.error(f"Error processing Redis message: {e}")
 
 # HTTP endpoints for direct progress updates
 from aiohttp import web, web_runner
@@ -139,7 +185,7 @@ async def progress_endpoint(request):
         
         if job_id:
             # Store in Redis and broadcast
-            await server.redis_client.publish(f"progress:{job_id}", json.dumps(data))
+            await server.cmd_redis.publish(f"progress:{job_id}", orjson.dumps(data))
             
             return web.json_response({"status": "success"})
         else:
@@ -177,7 +223,10 @@ async def main():
         "0.0.0.0", 
         8765,
         ping_interval=30,
-        ping_timeout=10
+        ping_timeout=10,
+        # Progress payloads are tiny; permessage-deflate would cost
+        # ~200KB of zlib state per connection for nothing
+        compression=None
     )
     
     # Start HTTP server for direct updates
@@ -201,4 +250,9 @@ async def main():
     await asyncio.gather(redis_task, websocket_task)
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        logger.warning("uvloop not available, using default event loop")
     asyncio.run(main())
\ No newline at end of file